@@ -13,10 +13,14 @@ Custom LSP Server — 一个用 pygls 构建的自定义 Language Server。
 """
 
 import argparse
+import asyncio
+import bisect
 import os
 import re
 import logging
+import operator
 import time
+from collections import OrderedDict
 from typing import Optional
 
 from pygls.lsp.server import LanguageServer
@@ -73,6 +77,24 @@ BUILTIN_DOCS = {
     "min": "min(iterable, *[, key, default]) / min(arg1, arg2, ...)\n\n返回最小值。",
 }
 
+# Python 关键字文档，用于 Hover
+KEYWORD_DOCS = {
+    "def": "定义函数",
+    "class": "定义类",
+    "import": "导入模块",
+    "from": "从模块导入",
+    "return": "从函数返回值",
+    "yield": "生成器 yield 值",
+    "async": "异步定义",
+    "await": "等待异步操作",
+    "with": "上下文管理器",
+    "lambda": "匿名函数",
+    "raise": "抛出异常",
+    "try": "异常处理块",
+    "except": "捕获异常",
+    "finally": "异常处理的 finally 块",
+}
+
 # 补全代码片段
 COMPLETION_SNIPPETS = [
     ("def", "def ${1:function_name}(${2:args}):\n    ${3:pass}", "定义函数"),
@@ -93,80 +115,289 @@ COMPLETION_SNIPPETS = [
 ]
 
 
-def _diagnose(text: str) -> list[types.Diagnostic]:
-    """分析文本，返回诊断信息列表。"""
-    diagnostics = []
-    lines = text.splitlines()
-
-    for i, line in enumerate(lines):
-        # 检测 TODO / FIXME
-        for tag in ("TODO", "FIXME", "HACK", "XXX"):
-            col = line.upper().find(tag)
-            if col != -1:
-                diagnostics.append(types.Diagnostic(
-                    range=types.Range(
-                        start=types.Position(line=i, character=col),
-                        end=types.Position(line=i, character=col + len(tag)),
-                    ),
-                    message=f"发现 {tag} 注释: {line.strip()}",
-                    severity=types.DiagnosticSeverity.Information,
-                    source="custom-lsp",
-                    tags=[types.DiagnosticTag.Unnecessary] if tag == "HACK" else [],
+# 预编译诊断用正则，均直接作用于整个文档：
+# 标签忽略大小写、可出现在任意位置，前瞻首字符让引擎快速跳过无关位置；
+# 行首类检测合并为一个带命名分组的多行正则（[^\S\r\n] 即不跨行的空白）
+_TAG_RE = re.compile(r"(?=[TtFfHhXx])(TODO|FIXME|HACK|XXX)", re.IGNORECASE)
+_LINE_RE = re.compile(
+    r"^[^\S\r\n]*(?:"
+    r"(?P<star>from[^\S\r\n]+\S+[^\S\r\n]+import[^\S\r\n]+\*)"
+    r"|(?P<bare>except[^\S\r\n]*:)"
+    r"|(?P<print>print\())",
+    re.MULTILINE,
+)
+# splitlines() 认作换行、但 re 的 ^ 不认的字符（\r\n 除外）；出现时退回逐行扫描
+_ODD_BREAK_RE = re.compile(r"\r(?!\n)|[\x0b\x0c\x1c-\x1e\x85\u2028\u2029]")
+# 行首类检测所需的字面量关键字
+_LINE_NEEDLES = ("import", "except", "print")
+
+# 诊断记录：(起始列, 结束列, 消息, 严重级别, tags)。热循环只产出轻量元组，
+# 与行号无关，可直接缓存复用；统一在 _flatten 中构造 types.Diagnostic
+DiagRecord = tuple[int, int, str, types.DiagnosticSeverity, Optional[list[types.DiagnosticTag]]]
+_HACK_TAGS = [types.DiagnosticTag.Unnecessary]
+
+
+def _line_starts(source: str) -> list[int]:
+    """计算每行的起始偏移，末尾追加哨兵 len(source) + 1。
+
+    第 k 行为 source[starts[k]:starts[k + 1]]（含换行符），共 len(starts) - 1 行。
+    """
+    starts = [0]
+    append = starts.append
+    find = source.find
+    i = find("\n")
+    while i != -1:
+        append(i + 1)
+        i = find("\n", i + 1)
+    append(len(source) + 1)
+    return starts
+
+
+def _scan_text(text: str) -> list[list[DiagRecord]]:
+    """对整个文本做整篇正则扫描，按行归集诊断记录（行的划分与 splitlines() 一致）。"""
+    starts = _line_starts(text)
+    n = len(starts) - 1
+    if not text or text.endswith("\n"):
+        n -= 1
+    per_line: list = [()] * n
+
+    def line_span(i: int) -> tuple[int, int]:
+        begin, end = starts[i], starts[i + 1] - 1
+        if end > begin and text[end - 1] == "\r":
+            end -= 1
+        return begin, end
+
+    def add(i: int, record: DiagRecord) -> None:
+        if not per_line[i]:
+            per_line[i] = []
+        per_line[i].append(record)
+
+    # 检测 TODO / FIXME
+    for m in _TAG_RE.finditer(text):
+        pos = m.start()
+        i = bisect.bisect_right(starts, pos) - 1
+        begin, end = line_span(i)
+        tag = m.group(1).upper()
+        add(i, (
+            pos - begin, m.end() - begin,
+            f"发现 {tag} 注释: {text[begin:end].strip()}",
+            types.DiagnosticSeverity.Information,
+            _HACK_TAGS if tag == "HACK" else [],
+        ))
+
+    # 行首类检测：文档中不含任何关键字时整体跳过
+    if any(needle in text for needle in _LINE_NEEDLES):
+        for m in _LINE_RE.finditer(text):
+            i = bisect.bisect_right(starts, m.start()) - 1
+            begin, end = line_span(i)
+            kind = m.lastgroup
+
+            # 检测 `import *`
+            if kind == "star":
+                add(i, (
+                    0, end - begin,
+                    "避免使用 `from xxx import *`，请显式导入",
+                    types.DiagnosticSeverity.Warning,
+                    None,
+                ))
+            # 检测 bare except
+            elif kind == "bare":
+                add(i, (
+                    0, end - begin,
+                    "避免使用裸 `except:`，请指定异常类型",
+                    types.DiagnosticSeverity.Warning,
+                    None,
+                ))
+            # 检测 `print()` 调试语句
+            elif "# noqa" not in text[begin:end]:
+                col = m.start("print") - begin
+                add(i, (
+                    col, col + 5,
+                    "检测到 print() 调用，生产代码中建议使用 logging",
+                    types.DiagnosticSeverity.Hint,
+                    None,
+                ))
+
+    # 检测超长行：相邻行偏移之差即「行长 + 1」，先在 C 层一次求最大值，
+    # 没有任何一行可能超长时（绝大多数文件）直接跳过逐行检查
+    gaps = list(map(operator.sub, starts[1:], starts))
+    if gaps and max(gaps) > MAX_LINE_LENGTH + 1:
+        for i, gap in enumerate(gaps):
+            if gap <= MAX_LINE_LENGTH + 1:
+                continue
+            begin, end = line_span(i)
+            length = end - begin
+            if length > MAX_LINE_LENGTH:
+                add(i, (
+                    MAX_LINE_LENGTH, length,
+                    f"行过长 ({length} > {MAX_LINE_LENGTH} 字符)",
+                    types.DiagnosticSeverity.Warning,
+                    None,
                 ))
 
-        # 检测超长行
-        if len(line) > MAX_LINE_LENGTH:
-            diagnostics.append(types.Diagnostic(
-                range=types.Range(
-                    start=types.Position(line=i, character=MAX_LINE_LENGTH),
-                    end=types.Position(line=i, character=len(line)),
-                ),
-                message=f"行过长 ({len(line)} > {MAX_LINE_LENGTH} 字符)",
-                severity=types.DiagnosticSeverity.Warning,
-                source="custom-lsp",
-            ))
-
-        # 检测 `import *`
-        if re.match(r"^\s*from\s+\S+\s+import\s+\*", line):
-            diagnostics.append(types.Diagnostic(
-                range=types.Range(
-                    start=types.Position(line=i, character=0),
-                    end=types.Position(line=i, character=len(line)),
-                ),
-                message="避免使用 `from xxx import *`，请显式导入",
-                severity=types.DiagnosticSeverity.Warning,
-                source="custom-lsp",
-            ))
-
-        # 检测 bare except
-        if re.match(r"^\s*except\s*:", line):
-            diagnostics.append(types.Diagnostic(
-                range=types.Range(
-                    start=types.Position(line=i, character=0),
-                    end=types.Position(line=i, character=len(line)),
-                ),
-                message="避免使用裸 `except:`，请指定异常类型",
-                severity=types.DiagnosticSeverity.Warning,
-                source="custom-lsp",
-            ))
-
-        # 检测 `print()` 调试语句
-        if re.match(r"^\s*print\(", line) and "# noqa" not in line:
-            diagnostics.append(types.Diagnostic(
-                range=types.Range(
-                    start=types.Position(line=i, character=line.index("print")),
-                    end=types.Position(line=i, character=line.index("print") + 5),
-                ),
-                message="检测到 print() 调用，生产代码中建议使用 logging",
-                severity=types.DiagnosticSeverity.Hint,
-                source="custom-lsp",
-            ))
+    return per_line
+
+
+def _diagnose_line(line: str) -> list[DiagRecord]:
+    """分析单行文本，返回该行的诊断记录（与整篇扫描共用 _scan_text，结果一致）。"""
+    return list(_scan_text(line)[0]) if line else []
+
+
+# 行级诊断缓存：行文本 -> 该行诊断记录，未修改的行无需重新扫描
+LINE_CACHE_SIZE = 4096
+_LINE_CACHE: "OrderedDict[str, list[DiagRecord]]" = OrderedDict()
+
+
+def _line_diagnostics(line: str) -> list[DiagRecord]:
+    """经行级缓存获取单行诊断记录。"""
+    cached = _LINE_CACHE.get(line)
+    if cached is None:
+        cached = _LINE_CACHE[line] = _diagnose_line(line)
+        if len(_LINE_CACHE) > LINE_CACHE_SIZE:
+            _LINE_CACHE.popitem(last=False)
+    else:
+        _LINE_CACHE.move_to_end(line)
+    return cached
+
+
+def _scan_lines(text: str) -> list[list[DiagRecord]]:
+    """诊断整个文档，返回每一行的诊断记录。"""
+    if _ODD_BREAK_RE.search(text) is None:
+        return _scan_text(text)
+    # 含有 re 不识别的换行符时，按 splitlines() 逐行扫描以保证行号一致
+    return [_line_diagnostics(line) for line in text.splitlines()]
+
+
+def _flatten(per_line: list[list[DiagRecord]]) -> list[types.Diagnostic]:
+    """把逐行诊断记录展开为定位到实际行号的诊断列表。"""
+    Diagnostic, Range, Position = types.Diagnostic, types.Range, types.Position
+    return [
+        Diagnostic(
+            range=Range(
+                start=Position(line=i, character=start),
+                end=Position(line=i, character=end),
+            ),
+            message=message,
+            severity=severity,
+            source="custom-lsp",
+            tags=tags,
+        )
+        for i, records in enumerate(per_line) if records
+        for start, end, message, severity, tags in records
+    ]
 
+
+def _diagnose(text: str) -> list[types.Diagnostic]:
+    """分析文本，返回诊断信息列表。"""
+    return _flatten(_scan_lines(text))
+
+
+# 每个打开文档的逐行诊断记录；None 表示该行被 didChange 修改过，需要重新扫描。
+# 只为不含 \r 的文档保留：\r\n 被拆开或合并时，按换行数推算的行号偏移会出错
+_LINE_DIAGS: dict[str, list[Optional[list[DiagRecord]]]] = {}
+
+
+def _mark_changed(uri: str, changes) -> None:
+    """根据 didChange 的增量 range 把受影响的行标记为待扫描，整篇替换时丢弃逐行结果。"""
+    per_line = _LINE_DIAGS.get(uri)
+    if per_line is None:
+        return
+    for change in changes:
+        if not isinstance(change, types.TextDocumentContentChangePartial) or "\r" in change.text:
+            _LINE_DIAGS.pop(uri, None)
+            return
+        # 替换旧文档的 [start, end] 行，新文本跨越 added + 1 行（按 splitlines 规则计换行数）
+        start, end = change.range.start.line, change.range.end.line
+        added = len((change.text + "x").splitlines()) - 1
+        if start >= len(per_line) and per_line:
+            # 位置落在最后一行之后：文档不以换行结尾时修改会并入最后一行
+            per_line[-1] = None
+        per_line[start:end + 1] = [None] * (added + 1)
+
+
+def _rescan(uri: str, text: str) -> list[list[DiagRecord]]:
+    """只重新扫描被标记的行；行数与文档对不上时退回全量扫描。"""
+    if "\r" in text:
+        # 行数对得上也不代表拼接正确（\r\n 的拆分与合并误差可以互相抵消），直接全量扫描且不保留
+        _LINE_DIAGS.pop(uri, None)
+        return _scan_lines(text)
+    per_line = _LINE_DIAGS.get(uri)
+    if per_line is not None:
+        lines = text.splitlines()
+        if len(lines) == len(per_line):
+            for i, diags in enumerate(per_line):
+                if diags is None:
+                    per_line[i] = _line_diagnostics(lines[i])
+            return per_line
+    per_line = _LINE_DIAGS[uri] = _scan_lines(text)
+    return per_line
+
+
+# 文档级诊断缓存：uri -> (文本, 诊断列表)，按 LRU 淘汰
+# 存文本本身而非哈希：命中时做相等比较（先比长度再 memcmp），哈希碰撞不会复用错误的诊断
+DIAG_CACHE_SIZE = 64
+_DIAG_CACHE: "OrderedDict[str, tuple[str, list[types.Diagnostic]]]" = OrderedDict()
+
+
+def _diagnose_cached(uri: str, text: str) -> list[types.Diagnostic]:
+    """带缓存的 _diagnose：文本未变（撤销/重做、仅保存）时直接复用上次结果。"""
+    cached = _DIAG_CACHE.get(uri)
+    if cached is not None and cached[0] == text:
+        _DIAG_CACHE.move_to_end(uri)
+        return cached[1]
+
+    diagnostics = _flatten(_rescan(uri, text))
+    _DIAG_CACHE[uri] = (text, diagnostics)
+    _DIAG_CACHE.move_to_end(uri)
+    if len(_DIAG_CACHE) > DIAG_CACHE_SIZE:
+        _DIAG_CACHE.popitem(last=False)
     return diagnostics
 
 
+# didChange 防抖：连续输入时只对最后一次修改做诊断
+DIAG_DEBOUNCE_SECONDS = 0.02
+_pending: dict[str, asyncio.TimerHandle] = {}
+
+
+def _cancel_pending(uri: str) -> bool:
+    """取消 uri 上尚未触发的防抖诊断，返回是否存在待处理任务。"""
+    handle = _pending.pop(uri, None)
+    if handle is None:
+        return False
+    handle.cancel()
+    return True
+
+
+def _flush_diagnostics(uri: str):
+    """防抖计时到期：对文档当前内容诊断并发布。"""
+    _pending.pop(uri, None)
+    doc = server.workspace.get_text_document(uri)
+    _publish(uri, _diagnose_cached(uri, doc.source))
+
+
+# 每个 uri 最近一次发布的诊断指纹，内容未变时不重复发送
+_LAST_PUBLISHED: dict[str, tuple] = {}
+
+
+def _fingerprint(diagnostics: list[types.Diagnostic]) -> tuple:
+    """诊断列表中会发送给客户端的字段。"""
+    return tuple(
+        (
+            d.range.start.line, d.range.start.character,
+            d.range.end.line, d.range.end.character,
+            d.message, d.severity, d.source, tuple(d.tags or ()),
+        )
+        for d in diagnostics
+    )
+
+
 def _publish(uri: str, diagnostics: list[types.Diagnostic]):
-    """发布诊断信息到客户端。"""
+    """发布诊断信息到客户端；与上次发布的内容相同时跳过。"""
+    fingerprint = _fingerprint(diagnostics)
+    if _LAST_PUBLISHED.get(uri) == fingerprint:
+        _log_call("publishDiagnostics →", f"uri={uri}  unchanged, skipped")
+        return
+    _LAST_PUBLISHED[uri] = fingerprint
     _log_call("publishDiagnostics →", f"uri={uri}  count={len(diagnostics)}")
     server.text_document_publish_diagnostics(
         types.PublishDiagnosticsParams(uri=uri, diagnostics=diagnostics)
@@ -195,7 +426,9 @@ def did_open(params: types.DidOpenTextDocumentParams):
     doc = params.text_document
     lines = doc.text.count("\n") + 1
     _log_call("textDocument/didOpen", f"uri={doc.uri}  lang={doc.language_id}  version={doc.version}  lines={lines}")
-    diags = _diagnose(doc.text)
+    _LINE_DIAGS.pop(doc.uri, None)
+    _forget_line_index(doc.uri)
+    diags = _diagnose_cached(doc.uri, doc.text)
     _publish(doc.uri, diags)
 
 
@@ -206,8 +439,12 @@ def did_change(params: types.DidChangeTextDocumentParams):
     ver = params.text_document.version
     changes = len(params.content_changes) if params.content_changes else 0
     _log_call("textDocument/didChange", f"uri={uri}  version={ver}  changes={changes}")
-    doc = server.workspace.get_text_document(uri)
-    _publish(uri, _diagnose(doc.source))
+    _mark_changed(uri, params.content_changes)
+    # handler 在 pygls 的事件循环线程中执行，用 call_later 做尾触发防抖，无需额外线程和锁
+    _cancel_pending(uri)
+    _pending[uri] = asyncio.get_running_loop().call_later(
+        DIAG_DEBOUNCE_SECONDS, _flush_diagnostics, uri
+    )
 
 
 @server.feature(types.TEXT_DOCUMENT_DID_SAVE)
@@ -215,8 +452,8 @@ def did_save(params: types.DidSaveTextDocumentParams):
     """文档保存时重新诊断。"""
     uri = params.text_document.uri
     _log_call("textDocument/didSave", f"uri={uri}")
-    doc = server.workspace.get_text_document(uri)
-    _publish(uri, _diagnose(doc.source))
+    _cancel_pending(uri)
+    _flush_diagnostics(uri)
 
 
 @server.feature(types.TEXT_DOCUMENT_DID_CLOSE)
@@ -224,12 +461,103 @@ def did_close(params: types.DidCloseTextDocumentParams):
     """文档关闭。"""
     uri = params.text_document.uri
     _log_call("textDocument/didClose", f"uri={uri}")
+    _cancel_pending(uri)
+    _DIAG_CACHE.pop(uri, None)
+    _LINE_DIAGS.pop(uri, None)
+    _LAST_PUBLISHED.pop(uri, None)
+    _forget_line_index(uri)
 
 
 # ──────────────────────────────────────────────
 # 2. Completion — 代码补全
 # ──────────────────────────────────────────────
 
+# 按文档版本缓存行偏移索引，补全/悬浮只切出需要的那一行
+LINE_INDEX_CACHE_SIZE = 32
+_LINE_INDEX_CACHE: "OrderedDict[tuple[str, int], list[int]]" = OrderedDict()
+
+
+def _line_index(source: str) -> list[int]:
+    """同 _line_starts，但文档含单独 \r 等换行符时按 splitlines 规则（与 pygls 一致）切分。"""
+    if not _ODD_BREAK_RE.search(source):
+        return _line_starts(source)
+    segs = source.splitlines(keepends=True)
+    starts = [0]
+    for seg in segs:
+        starts.append(starts[-1] + len(seg))
+    # 末行没有换行符时，最后一个偏移不是新行的起点
+    if segs and len(segs[-1].splitlines()[0]) == len(segs[-1]):
+        starts.pop()
+    starts.append(len(source) + 1)
+    return starts
+
+
+def _forget_line_index(uri: str) -> None:
+    """丢弃某文档所有版本的行索引：重新打开的文档可能复用同一个版本号。"""
+    for key in [key for key in _LINE_INDEX_CACHE if key[0] == uri]:
+        del _LINE_INDEX_CACHE[key]
+
+
+def _get_line(doc, line: int) -> Optional[str]:
+    """返回文档第 line 行（不含换行符），越界时返回 None。"""
+    if doc.version is None:
+        starts = _line_index(doc.source)
+    else:
+        key = (doc.uri, doc.version)
+        starts = _LINE_INDEX_CACHE.get(key)
+        if starts is not None:
+            _LINE_INDEX_CACHE.move_to_end(key)
+        else:
+            starts = _LINE_INDEX_CACHE[key] = _line_index(doc.source)
+            if len(_LINE_INDEX_CACHE) > LINE_INDEX_CACHE_SIZE:
+                _LINE_INDEX_CACHE.popitem(last=False)
+    if not 0 <= line < len(starts) - 1:
+        return None
+    text = doc.source[starts[line]:starts[line + 1]]
+    return text.splitlines()[0] if text else ""
+
+
+def _split_doc(doc_str: str) -> tuple[str, str]:
+    """拆分 BUILTIN_DOCS 条目为 (签名, 说明)：首行与末行。"""
+    return doc_str.partition("\n")[0], doc_str.rpartition("\n")[2]
+
+
+def _builtin_markdown(doc_str: str) -> str:
+    """内置函数补全项的 Markdown 文档。"""
+    signature, summary = _split_doc(doc_str)
+    return f"```python\n{signature}\n```\n\n{summary}"
+
+
+# 补全项是静态的，启动时构造一次，每次请求只做前缀过滤
+_SNIPPET_ITEMS = [
+    types.CompletionItem(
+        label=label,
+        kind=types.CompletionItemKind.Snippet,
+        detail=doc_str,
+        insert_text=snippet,
+        insert_text_format=types.InsertTextFormat.Snippet,
+    )
+    for label, snippet, doc_str in COMPLETION_SNIPPETS
+]
+_BUILTIN_ITEMS = [
+    types.CompletionItem(
+        label=name,
+        kind=types.CompletionItemKind.Function,
+        detail="Python 内置函数",
+        documentation=types.MarkupContent(
+            kind=types.MarkupKind.Markdown,
+            value=_builtin_markdown(doc_str),
+        ),
+    )
+    for name, doc_str in BUILTIN_DOCS.items()
+]
+_ALL_COMPLETIONS = types.CompletionList(is_incomplete=False, items=_SNIPPET_ITEMS + _BUILTIN_ITEMS)
+
+# 按 label 排序的前缀索引：二分查找定位前缀区间，O(log N + k)
+_SORTED_ITEMS = sorted(_ALL_COMPLETIONS.items, key=lambda it: it.label)
+_SORTED_LABELS = [it.label for it in _SORTED_ITEMS]
+
+
 @server.feature(
     types.TEXT_DOCUMENT_COMPLETION,
     types.CompletionOptions(trigger_characters=[".", " "]),
@@ -241,52 +569,68 @@ def completions(params: types.CompletionParams) -> types.CompletionList:
     _log_call("textDocument/completion", f"uri={uri}  line={pos.line}  char={pos.character}")
 
     doc = server.workspace.get_text_document(uri)
-    line = doc.source.splitlines()[pos.line] if doc.source.splitlines() else ""
+    line = _get_line(doc, pos.line) or ""
     current_word = _get_word_at(line, pos.character)
 
-    items = []
-
-    for label, snippet, doc_str in COMPLETION_SNIPPETS:
-        if current_word and not label.startswith(current_word):
-            continue
-        items.append(types.CompletionItem(
-            label=label,
-            kind=types.CompletionItemKind.Snippet,
-            detail=doc_str,
-            insert_text=snippet,
-            insert_text_format=types.InsertTextFormat.Snippet,
-        ))
+    if current_word:
+        lo = bisect.bisect_left(_SORTED_LABELS, current_word)
+        hi = bisect.bisect_left(_SORTED_LABELS, current_word + "\uffff", lo)
+        items = _SORTED_ITEMS[lo:hi]
+        result = types.CompletionList(is_incomplete=False, items=items)
+    else:
+        result = _ALL_COMPLETIONS
+
+    _log_call("textDocument/completion →", f"返回 {len(result.items)} 个补全项  word={current_word!r}")
+    return result
+
+
+def _word_start(line: str, end: int) -> int:
+    """从 end 向左跨过单词字符，返回单词起点。"""
+    # 只扫描单词本身；`\w*$` 这类 search 在长单词上会从每个位置重试并回溯，退化为 O(n²)
+    start = min(end, len(line))
+    while start > 0 and (line[start - 1].isalnum() or line[start - 1] == "_"):
+        start -= 1
+    return start
 
-    for name, doc_str in BUILTIN_DOCS.items():
-        if current_word and not name.startswith(current_word):
-            continue
-        items.append(types.CompletionItem(
-            label=name,
-            kind=types.CompletionItemKind.Function,
-            detail="Python 内置函数",
-            documentation=types.MarkupContent(
-                kind=types.MarkupKind.Markdown,
-                value=f"```python\n{doc_str.split(chr(10))[0]}\n```\n\n{doc_str.split(chr(10))[-1]}",
-            ),
-        ))
 
-    _log_call("textDocument/completion →", f"返回 {len(items)} 个补全项  word={current_word!r}")
-    return types.CompletionList(is_incomplete=False, items=items)
+_IDENT_START_RE = re.compile(r"[a-zA-Z_]")
 
 
 def _get_word_at(line: str, character: int) -> str:
     """获取光标位置的当前单词。"""
     if not line or character <= 0:
         return ""
-    left = line[:character]
-    match = re.search(r"[a-zA-Z_]\w*$", left)
-    return match.group() if match else ""
+    end = min(character, len(line))
+    # 单词从光标左侧单词字符串中第一个字母/下划线开始（跳过前导数字）
+    match = _IDENT_START_RE.search(line, _word_start(line, end), end)
+    return line[match.start():end] if match else ""
 
 
 # ──────────────────────────────────────────────
 # 3. Hover — 悬浮提示
 # ──────────────────────────────────────────────
 
+# Hover 内容是静态的，启动时构造一次，请求时只做字典查找
+_BUILTIN_HOVERS = {
+    name: types.Hover(
+        contents=types.MarkupContent(
+            kind=types.MarkupKind.Markdown,
+            value=f"### `{name}`\n\n{_builtin_markdown(doc_str)}",
+        ),
+    )
+    for name, doc_str in BUILTIN_DOCS.items()
+}
+_KEYWORD_HOVERS = {
+    word: types.Hover(
+        contents=types.MarkupContent(
+            kind=types.MarkupKind.Markdown,
+            value=f"**`{word}`** — Python 关键字\n\n{desc}",
+        ),
+    )
+    for word, desc in KEYWORD_DOCS.items()
+}
+
+
 @server.feature(types.TEXT_DOCUMENT_HOVER)
 def hover(params: types.HoverParams) -> Optional[types.Hover]:
     """鼠标悬浮时显示文档提示。"""
@@ -295,12 +639,11 @@ def hover(params: types.HoverParams) -> Optional[types.Hover]:
     _log_call("textDocument/hover", f"uri={uri}  line={pos.line}  char={pos.character}")
 
     doc = server.workspace.get_text_document(uri)
-    lines = doc.source.splitlines()
-    if pos.line >= len(lines):
+    line = _get_line(doc, pos.line)
+    if line is None:
         _log_call("textDocument/hover →", "line out of range, return None")
         return None
 
-    line = lines[pos.line]
     word = _get_word_at_position(line, pos.character)
 
     if not word:
@@ -309,53 +652,20 @@ def hover(params: types.HoverParams) -> Optional[types.Hover]:
 
     _log_call("textDocument/hover →", f"word={word!r}")
 
-    if word in BUILTIN_DOCS:
-        return types.Hover(
-            contents=types.MarkupContent(
-                kind=types.MarkupKind.Markdown,
-                value=f"### `{word}`\n\n```python\n{BUILTIN_DOCS[word].split(chr(10))[0]}\n```\n\n{BUILTIN_DOCS[word].split(chr(10))[-1]}",
-            ),
-        )
+    return _BUILTIN_HOVERS.get(word) or _KEYWORD_HOVERS.get(word)
 
-    # Python 关键字提示
-    keyword_docs = {
-        "def": "定义函数",
-        "class": "定义类",
-        "import": "导入模块",
-        "from": "从模块导入",
-        "return": "从函数返回值",
-        "yield": "生成器 yield 值",
-        "async": "异步定义",
-        "await": "等待异步操作",
-        "with": "上下文管理器",
-        "lambda": "匿名函数",
-        "raise": "抛出异常",
-        "try": "异常处理块",
-        "except": "捕获异常",
-        "finally": "异常处理的 finally 块",
-    }
-    if word in keyword_docs:
-        return types.Hover(
-            contents=types.MarkupContent(
-                kind=types.MarkupKind.Markdown,
-                value=f"**`{word}`** — Python 关键字\n\n{keyword_docs[word]}",
-            ),
-        )
 
-    return None
+# \w 在 str 模式下等价于 ch.isalnum() or ch == "_"
+_WORD_RIGHT_RE = re.compile(r"\w*")
 
 
 def _get_word_at_position(line: str, character: int) -> str:
     """获取指定位置的完整单词。"""
     if not line:
         return ""
-    start = character
-    while start > 0 and (line[start - 1].isalnum() or line[start - 1] == "_"):
-        start -= 1
-    end = character
-    while end < len(line) and (line[end].isalnum() or line[end] == "_"):
-        end += 1
-    return line[start:end]
+    left = line[_word_start(line, character):character]
+    right = _WORD_RIGHT_RE.match(line, character)
+    return left + right.group()
 
 
 # ──────────────────────────────────────────────
@@ -17,16 +17,27 @@ OpenCode 通过 command 启动此脚本，用 stdio 与 OpenCode 通信；
 import sys
 import socket
 import select
+import selectors
 import struct
 import os
 import threading
+from collections import deque
+from itertools import islice
+
+CHUNK_SIZE = 4096
 
 def _read(stream, n):
     if hasattr(stream, "recv"):
         return stream.recv(n)
-    data = stream.read(n)
+    # read1 返回已就绪的数据，不会为凑满 n 字节而阻塞
+    data = stream.read1(n) if hasattr(stream, "read1") else stream.read(n)
     return data if data else None
 
+def _read_into(stream, view):
+    if hasattr(stream, "recv_into"):
+        return stream.recv_into(view)
+    return stream.readinto(view)
+
 def _write(stream, data):
     if hasattr(stream, "sendall"):
         stream.sendall(data)
@@ -34,38 +45,87 @@ def _write(stream, data):
         stream.write(data)
         stream.flush()
 
-def read_content_length(stream):
-    header = b""
-    while b"\r\n\r\n" not in header:
-        b = _read(stream, 1)
-        if not b:
-            return None
-        header += b
+class BufferedReader:
+    """按块读取 stream，把多读的字节留给下一次 header / body 使用。"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buf = bytearray()
+
+    def _fill(self):
+        chunk = _read(self.stream, CHUNK_SIZE)
+        if not chunk:
+            return False
+        self.buf += chunk
+        return True
+
+    def read_until(self, sep):
+        start = 0
+        while True:
+            i = self.buf.find(sep, start)
+            if i != -1:
+                end = i + len(sep)
+                data = bytes(self.buf[:end])
+                del self.buf[:end]
+                return data
+            start = max(0, len(self.buf) - len(sep) + 1)
+            if not self._fill():
+                return None
+
+    def read_exact(self, n):
+        # 预分配 body 缓冲区，先拷入已缓冲部分，其余直接 recv_into / readinto 原地填充
+        data = bytearray(n)
+        got = min(n, len(self.buf))
+        data[:got] = self.buf[:got]
+        del self.buf[:got]
+        view = memoryview(data)
+        while got < n:
+            k = _read_into(self.stream, view[got:])
+            if not k:
+                return None
+            got += k
+        return data
+
+def parse_content_length(header):
     for line in header.decode("ascii").split("\r\n"):
         if line.lower().startswith("content-length:"):
             return int(line.split(":")[1].strip())
     return 0
 
-def read_message(stream):
-    n = read_content_length(stream)
+def read_content_length(reader):
+    header = reader.read_until(b"\r\n\r\n")
+    if header is None:
+        return None
+    return parse_content_length(header)
+
+def read_message(reader):
+    n = read_content_length(reader)
     if n is None:
         return None
-    data = b""
-    while len(data) < n:
-        chunk = _read(stream, n - len(data))
-        if not chunk:
-            return None
-        data += chunk
-    return data
+    return reader.read_exact(n)
+
+def _sendmsg_all(sock, header, data):
+    # header 与 body 通过一次 sendmsg 聚集写出，无需拼接；部分发送时用 sendall 补齐剩余部分
+    # （POSIX 上 stdio 为普通文件、退回 relay 时使用；Windows 的 socket 没有 sendmsg）
+    sent = sock.sendmsg([header, data])
+    if sent < len(header):
+        sock.sendall(header[sent:])
+        sock.sendall(data)
+    elif sent < len(header) + len(data):
+        sock.sendall(memoryview(data)[sent - len(header):])
 
 def write_message(stream, data: bytes):
-    header = f"Content-Length: {len(data)}\r\n\r\n"
-    _write(stream, header.encode("ascii") + data)
+    header = b"Content-Length: %d\r\n\r\n" % len(data)
+    if hasattr(stream, "sendmsg"):
+        _sendmsg_all(stream, header, data)
+    else:
+        _write(stream, header + data)
 
 def relay(a, b, label):
+    reader = BufferedReader(a)
     try:
         while True:
-            msg = read_message(a)
+            msg = read_message(reader)
             if msg is None:
                 break
             write_message(b, msg)
@@ -80,6 +140,158 @@ def relay(a, b, label):
         except OSError:
             pass
 
+class MessageParser:
+    """增量解析 LSP 消息：feed 任意大小的字节块，返回其中已完整的消息体。"""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.body_len = None
+
+    def feed(self, chunk):
+        self.buf += chunk
+        messages = []
+        while True:
+            if self.body_len is None:
+                i = self.buf.find(b"\r\n\r\n")
+                if i == -1:
+                    break
+                self.body_len = parse_content_length(bytes(self.buf[:i + 4]))
+                del self.buf[:i + 4]
+            if len(self.buf) < self.body_len:
+                break
+            messages.append(bytes(self.buf[:self.body_len]))
+            del self.buf[:self.body_len]
+            self.body_len = None
+        return messages
+
+# 单个方向待写出字节超过该值时暂停读取来源，避免对端写得比另一侧收得快时无限堆积
+HIGH_WATER = 1 << 20
+# 单次 sendmsg / writev 最多聚集的缓冲区个数（远低于 IOV_MAX）
+IOV_BATCH = 64
+
+class _Direction:
+    """单向转发状态：增量解析器 + 待写出的 header/body 缓冲区队列。"""
+
+    def __init__(self):
+        self.parser = MessageParser()
+        self.out = deque()
+        self.pending = 0
+        self.eof = False
+
+    def pull(self, recv):
+        try:
+            chunk = recv(CHUNK_SIZE)
+        except BlockingIOError:
+            return
+        if not chunk:
+            self.eof = True
+            return
+        for msg in self.parser.feed(chunk):
+            # header 与 body 分别入队，不做拼接，由 push 一次聚集写出
+            header = b"Content-Length: %d\r\n\r\n" % len(msg)
+            self.out.append(header)
+            self.out.append(msg)
+            self.pending += len(header) + len(msg)
+
+    def push(self, send):
+        # send 为 sock.sendmsg 或 os.writev：接受缓冲区列表，返回实际写出的字节数
+        try:
+            n = send(list(islice(self.out, IOV_BATCH)))
+        except BlockingIOError:
+            return
+        self.pending -= n
+        while n:
+            head = self.out[0]
+            if n < len(head):
+                self.out[0] = memoryview(head)[n:]
+                break
+            self.out.popleft()
+            n -= len(head)
+
+def _set_events(sel, fileobj, events):
+    key = sel.get_map().get(fileobj)
+    if key is None:
+        if events:
+            sel.register(fileobj, events)
+    elif not events:
+        sel.unregister(fileobj)
+    elif key.events != events:
+        sel.modify(fileobj, events)
+
+def pump(sock, stdin_fd, stdout_fd):
+    """单线程非阻塞事件循环：两个方向各有出站缓冲区，目标可写时才排空。
+
+    任何一端都不会阻塞在写上，对端一边收一边回写大消息时也不会互相卡死。
+    stdin/stdout 无法注册到 selector 时（epoll 不支持普通文件，如 `< in.bin > out.log`）
+    返回 False，由调用方退回线程转发。
+    """
+    sel = selectors.DefaultSelector()
+    try:
+        sel.register(stdin_fd, selectors.EVENT_READ)
+        sel.register(stdout_fd, selectors.EVENT_WRITE)
+    except (PermissionError, ValueError):
+        sel.close()
+        return False
+    sel.unregister(stdout_fd)
+
+    up, down = _Direction(), _Direction()  # stdin -> tcp, tcp -> stdout
+    shut_wr = False
+    stdout_blocking = os.get_blocking(stdout_fd)
+    sock.setblocking(False)
+    os.set_blocking(stdout_fd, False)
+    try:
+        while True:
+            if up.eof and not up.out and not shut_wr:
+                sock.shutdown(socket.SHUT_WR)
+                shut_wr = True
+            sock_events = selectors.EVENT_WRITE if up.out else 0
+            if not down.eof and down.pending < HIGH_WATER:
+                sock_events |= selectors.EVENT_READ
+            _set_events(sel, sock, sock_events)
+            stdin_events = selectors.EVENT_READ if not up.eof and up.pending < HIGH_WATER else 0
+            _set_events(sel, stdin_fd, stdin_events)
+            _set_events(sel, stdout_fd, selectors.EVENT_WRITE if down.out else 0)
+            if not sel.get_map():
+                break
+            for key, mask in sel.select():
+                if key.fileobj is sock:
+                    if mask & selectors.EVENT_WRITE:
+                        up.push(sock.sendmsg)
+                    if mask & selectors.EVENT_READ:
+                        down.pull(sock.recv)
+                elif key.fileobj == stdin_fd:
+                    up.pull(lambda n: os.read(stdin_fd, n))
+                else:
+                    down.push(lambda bufs: os.writev(stdout_fd, bufs))
+    except (BrokenPipeError, ConnectionResetError, OSError):
+        pass
+    finally:
+        sel.close()
+        os.set_blocking(stdout_fd, stdout_blocking)
+    return True
+
+SOCK_BUF_SIZE = 1 << 20
+
+def tune_socket(sock):
+    # LSP 是小包请求/响应，关闭 Nagle 避免 header/body 写入被延迟合并
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # 以下均为尽力而为的调优：常量存在不代表运行中的内核接受（如旧版 Windows），失败时保持默认
+    # 放大收发缓冲区，didOpen 等大消息不会被默认窗口限速
+    # 开启 keepalive，半开连接能被及时发现而不是静默挂起
+    options = [
+        (socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF_SIZE),
+        (socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF_SIZE),
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+    for name, value in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    for level, opt, value in options:
+        try:
+            sock.setsockopt(level, opt, value)
+        except OSError:
+            pass
+
 def main():
     host = os.environ.get("LSP_TCP_HOST") or (sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1")
     port = int(os.environ.get("LSP_TCP_PORT") or (sys.argv[2] if len(sys.argv) > 2 else "6008"))
@@ -93,9 +305,15 @@ def main():
         sys.exit(1)
 
     sock.setblocking(True)
+    tune_socket(sock)
     stdin = sys.stdin.buffer
     stdout = sys.stdout.buffer
 
+    if sys.platform != "win32" and pump(sock, stdin.fileno(), stdout.fileno()):
+        return
+
+    # Windows 上 select 只支持 socket，无法监听 stdin 管道；stdin/stdout 是普通文件时
+    # epoll 也无法注册。两种情况都退回双线程阻塞转发
     t1 = threading.Thread(target=relay, args=(stdin, sock, "stdin->tcp"), daemon=True)
     t2 = threading.Thread(target=relay, args=(sock, stdout, "tcp->stdout"), daemon=True)
     t1.start()
@@ -4,31 +4,45 @@ LSP Server 集成测试 — 通过 JSON-RPC 协议与 custom_lsp_server 通信
 用法: python .opencode/lsp/test_lsp.py
 """
 
+import itertools
 import json
 import subprocess
 import sys
 import os
+import re
 import time
 import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+try:
+    import orjson  # 可选依赖：直接产出/解析 bytes，比标准库 json 快数倍
+except ImportError:
+    orjson = None
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 SERVER_SCRIPT = os.path.join(SCRIPT_DIR, "custom_lsp_server.py")
 
 # ── JSON-RPC helpers ──────────────────────────
 
-_msg_id = 0
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+else:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
 
+    def _loads(data):
+        # 标准库 json.loads 不接受 memoryview，这里转成 bytes（与原先 read() 的一次分配相当）
+        return json.loads(bytes(data))
 
-def _next_id():
-    global _msg_id
-    _msg_id += 1
-    return _msg_id
+# itertools.count 的自增在 C 层完成，不需要全局变量和锁
+_next_id = itertools.count(1).__next__
 
 
-def encode_message(body: dict) -> bytes:
-    payload = json.dumps(body).encode("utf-8")
-    header = f"Content-Length: {len(payload)}\r\n\r\n"
-    return header.encode("ascii") + payload
+def encode_message(body: dict) -> tuple[bytes, bytes]:
+    """返回 (header, payload)，由调用方分两次写入带缓冲的流，省去拼接拷贝。"""
+    payload = _dumps(body)
+    return b"Content-Length: %d\r\n\r\n" % len(payload), payload
 
 
 def make_request(method: str, params: dict | None = None) -> dict:
@@ -46,54 +60,80 @@ class JsonRpcReader:
         self.stream = stream
         self.responses: dict[int, dict] = {}
         self.notifications: list[dict] = []
-        self._lock = threading.Lock()
+        self._futures: dict[int, Future] = {}
+        # 复用的 body 缓冲区，只在遇到更大的消息时扩容
+        self._body_buf = bytearray(65536)
+        # 读线程收到消息后 notify_all，等待方被立即唤醒，无需轮询
+        self._cond = threading.Condition()
         self._thread = threading.Thread(target=self._read_loop, daemon=True)
         self._thread.start()
 
     def _read_loop(self):
         while True:
             try:
-                header = b""
-                while b"\r\n\r\n" not in header:
-                    chunk = self.stream.read(1)
-                    if not chunk:
-                        return
-                    header += chunk
-
+                # proc.stdout 本身是带缓冲的 BufferedReader，按行读取 header 而不是逐字节 read(1)
                 content_length = 0
-                for line in header.decode("ascii").split("\r\n"):
-                    if line.lower().startswith("content-length:"):
-                        content_length = int(line.split(":")[1].strip())
-
-                body = self.stream.read(content_length)
-                msg = json.loads(body.decode("utf-8"))
+                while True:
+                    line = self.stream.readline()
+                    if not line:
+                        return
+                    if line == b"\r\n":
+                        break
+                    # 规范服务器总是输出固定大小写，先走 bytes 前缀比较，未命中再大小写不敏感兜底
+                    if line.startswith(b"Content-Length:") or line[:15].lower() == b"content-length:":
+                        content_length = int(line[15:].strip())
+
+                if content_length > len(self._body_buf):
+                    self._body_buf = bytearray(content_length)
+                body = memoryview(self._body_buf)[:content_length]
+                got = 0
+                while got < content_length:
+                    n = self.stream.readinto(body[got:])
+                    if not n:
+                        return
+                    got += n
+                msg = _loads(body)
 
-                with self._lock:
+                with self._cond:
                     if "id" in msg and "method" not in msg:
-                        self.responses[msg["id"]] = msg
+                        fut = self._futures.pop(msg["id"], None)
+                        if fut is not None:
+                            fut.set_result(msg)
+                        else:
+                            self.responses[msg["id"]] = msg
                     else:
                         self.notifications.append(msg)
+                    self._cond.notify_all()
             except Exception:
                 return
 
+    def expect(self, msg_id: int) -> Future:
+        """登记一个待响应的请求 id，响应到达时由读线程填充 Future。"""
+        fut = Future()
+        with self._cond:
+            if msg_id in self.responses:
+                fut.set_result(self.responses.pop(msg_id))
+            else:
+                self._futures[msg_id] = fut
+        return fut
+
     def wait_response(self, msg_id: int, timeout: float = 10.0) -> dict | None:
-        deadline = time.time() + timeout
-        while time.time() < deadline:
-            with self._lock:
-                if msg_id in self.responses:
-                    return self.responses.pop(msg_id)
-            time.sleep(0.05)
+        with self._cond:
+            if self._cond.wait_for(lambda: msg_id in self.responses, timeout):
+                return self.responses.pop(msg_id)
         return None
 
     def wait_notification(self, method: str, timeout: float = 5.0) -> dict | None:
-        deadline = time.time() + timeout
-        while time.time() < deadline:
-            with self._lock:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
                 for i, n in enumerate(self.notifications):
                     if n.get("method") == method:
                         return self.notifications.pop(i)
-            time.sleep(0.05)
-        return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
 
 
 # ── Test runner ───────────────────────────────
@@ -124,14 +164,21 @@ x = "this line is intentionally written to be very very very very very very very
 
 PASS = "\033[92m✓ PASS\033[0m"
 FAIL = "\033[91m✗ FAIL\033[0m"
-results = []
+
+# 诊断类别：import * / TODO / bare except / print / 超长行，分组顺序即 found[] 下标
+_DIAG_RE = re.compile(r"(import \*)|(TODO)|(except)|(print)|(过长)", re.IGNORECASE)
+
+_passed = 0
+_total = 0
 
 
 def check(name: str, condition: bool, detail: str = ""):
-    status = PASS if condition else FAIL
-    results.append(condition)
+    global _passed, _total
+    _total += 1
+    if condition:
+        _passed += 1
     extra = f"  ({detail})" if detail else ""
-    print(f"  {status}  {name}{extra}")
+    sys.stdout.write(f"  {PASS if condition else FAIL}  {name}{extra}\n")
 
 
 def main():
@@ -149,7 +196,10 @@ def main():
     reader = JsonRpcReader(proc.stdout)
 
     def send(msg: dict):
-        proc.stdin.write(encode_message(msg))
+        # proc.stdin 是 BufferedWriter，两次 write 在缓冲区内合并，flush 时一次系统调用发出
+        header, payload = encode_message(msg)
+        proc.stdin.write(header)
+        proc.stdin.write(payload)
         proc.stdin.flush()
 
     def request(method: str, params: dict | None = None) -> dict | None:
@@ -157,6 +207,19 @@ def main():
         send(msg)
         return reader.wait_response(msg["id"])
 
+    def request_async(method: str, params: dict | None = None) -> Future:
+        # 先登记再发送，避免响应先于登记到达
+        msg = make_request(method, params)
+        fut = reader.expect(msg["id"])
+        send(msg)
+        return fut
+
+    def result(fut: Future, timeout: float = 10.0) -> dict | None:
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            return None
+
     try:
         # ── 1. Initialize ──
         print("[1] Initialize 握手")
@@ -171,8 +234,8 @@ def main():
             check("支持 completionProvider", "completionProvider" in caps)
             check("支持 hoverProvider", "hoverProvider" in caps)
 
+        # 无需 sleep：后续请求在同一条管道上按序处理
         send(make_notification("initialized", {}))
-        time.sleep(0.3)
 
         # ── 2. Open document → Diagnostics ──
         print("\n[2] Diagnostics 诊断检测")
@@ -187,22 +250,41 @@ def main():
 
         diag_notif = reader.wait_notification("textDocument/publishDiagnostics", timeout=5)
         check("收到 publishDiagnostics 通知", diag_notif is not None)
+        open_diags = (diag_notif or {}).get("params", {}).get("diagnostics")
 
         if diag_notif:
             diags = diag_notif.get("params", {}).get("diagnostics", [])
             messages = [d["message"] for d in diags]
-            check("检测到 import *", any("import *" in m for m in messages), f"共 {len(diags)} 条诊断")
-            check("检测到 TODO", any("TODO" in m for m in messages))
-            check("检测到 bare except", any("except" in m for m in messages))
-            check("检测到 print()", any("print" in m for m in messages))
-            check("检测到超长行", any("行过长" in m or "过长" in m for m in messages))
-
-        # ── 3. Completion ──
-        print("\n[3] Completion 代码补全")
-        resp = request("textDocument/completion", {
+            # 一次扫描 messages，按命中的分组编号记录各类诊断是否出现
+            found = [False] * 5
+            for m in messages:
+                for match in _DIAG_RE.finditer(m):
+                    found[match.lastindex - 1] = True
+            check("检测到 import *", found[0], f"共 {len(diags)} 条诊断")
+            check("检测到 TODO", found[1])
+            check("检测到 bare except", found[2])
+            check("检测到 print()", found[3])
+            check("检测到超长行", found[4])
+
+        # completion 与两个 hover 互不依赖：一次性发出，再依次取结果
+        completion_fut = request_async("textDocument/completion", {
             "textDocument": {"uri": TEST_FILE_URI},
             "position": {"line": 5, "character": 3},
         })
+        # hover over "print" at line 6
+        hover_print_fut = request_async("textDocument/hover", {
+            "textDocument": {"uri": TEST_FILE_URI},
+            "position": {"line": 6, "character": 5},
+        })
+        # hover over keyword "def" at line 5
+        hover_def_fut = request_async("textDocument/hover", {
+            "textDocument": {"uri": TEST_FILE_URI},
+            "position": {"line": 5, "character": 1},
+        })
+
+        # ── 3. Completion ──
+        print("\n[3] Completion 代码补全")
+        resp = result(completion_fut)
         check("completion 返回结果", resp is not None)
         if resp:
             items = resp.get("result", {})
@@ -215,11 +297,7 @@ def main():
 
         # ── 4. Hover ──
         print("\n[4] Hover 悬浮提示")
-        # hover over "print" at line 6
-        resp = request("textDocument/hover", {
-            "textDocument": {"uri": TEST_FILE_URI},
-            "position": {"line": 6, "character": 5},
-        })
+        resp = result(hover_print_fut)
         check("hover 返回结果", resp is not None)
         if resp:
             hover_result = resp.get("result")
@@ -229,27 +307,83 @@ def main():
                 value = contents.get("value", "") if isinstance(contents, dict) else str(contents)
                 check("hover 包含 print 文档", "print" in value.lower(), f"内容: {value[:80]}...")
 
-        # hover over keyword "def" at line 5
-        resp = request("textDocument/hover", {
-            "textDocument": {"uri": TEST_FILE_URI},
-            "position": {"line": 5, "character": 1},
-        })
+        resp = result(hover_def_fut)
         if resp and resp.get("result"):
             contents = resp["result"].get("contents", {})
             value = contents.get("value", "") if isinstance(contents, dict) else str(contents)
             check("hover 支持 Python 关键字", "def" in value.lower())
 
+        # ── 5. didChange → 增量诊断 ──
+        print("\n[5] didChange 增量诊断")
+
+        def todo_lines(notif: dict | None) -> list[int]:
+            diags = (notif or {}).get("params", {}).get("diagnostics", [])
+            return sorted(d["range"]["start"]["line"] for d in diags if "TODO" in d["message"])
+
+        # 在第 1 行（空行）前插入一行 TODO：原第 4 行的 TODO 应顺移到第 5 行
+        send(make_notification("textDocument/didChange", {
+            "textDocument": {"uri": TEST_FILE_URI, "version": 2},
+            "contentChanges": [{
+                "range": {"start": {"line": 1, "character": 0}, "end": {"line": 1, "character": 0}},
+                "text": "# TODO: added by didChange\n",
+            }],
+        }))
+        diag_notif = reader.wait_notification("textDocument/publishDiagnostics", timeout=5)
+        check("插入 TODO 后收到诊断", diag_notif is not None)
+        check("新增 TODO 被检测且原 TODO 行号顺移", todo_lines(diag_notif) == [1, 5],
+              f"TODO 行: {todo_lines(diag_notif)}")
+
+        # 删除刚插入的整行：诊断应恢复为只有第 4 行的 TODO
+        send(make_notification("textDocument/didChange", {
+            "textDocument": {"uri": TEST_FILE_URI, "version": 3},
+            "contentChanges": [{
+                "range": {"start": {"line": 1, "character": 0}, "end": {"line": 2, "character": 0}},
+                "text": "",
+            }],
+        }))
+        diag_notif = reader.wait_notification("textDocument/publishDiagnostics", timeout=5)
+        check("删除 TODO 后收到诊断", diag_notif is not None)
+        check("删除的 TODO 不再报告", todo_lines(diag_notif) == [4], f"TODO 行: {todo_lines(diag_notif)}")
+        check("增量诊断与打开时一致",
+              (diag_notif or {}).get("params", {}).get("diagnostics") == open_diags)
+
+        # \r\n 被拆开/合并时按换行数预测行号会出错：删掉 \r\n 中的 \n、在 \n 前插入 \r，
+        # 两处误差互相抵消，行数仍对得上；末尾追加 FIXME 保证诊断有变化、一定会重新发布
+        crlf_uri = "file:///tmp/test_lsp_crlf.py"
+        send(make_notification("textDocument/didOpen", {
+            "textDocument": {"uri": crlf_uri, "languageId": "python", "version": 1,
+                             "text": "x\r\nTODO\nb\nc"},
+        }))
+        reader.wait_notification("textDocument/publishDiagnostics", timeout=5)
+        send(make_notification("textDocument/didChange", {
+            "textDocument": {"uri": crlf_uri, "version": 2},
+            "contentChanges": [
+                {"range": {"start": {"line": 0, "character": 2}, "end": {"line": 1, "character": 0}},
+                 "text": ""},
+                {"range": {"start": {"line": 2, "character": 1}, "end": {"line": 2, "character": 1}},
+                 "text": "\r"},
+                {"range": {"start": {"line": 3, "character": 1}, "end": {"line": 3, "character": 1}},
+                 "text": "\n# FIXME: z"},
+            ],
+        }))
+        diag_notif = reader.wait_notification("textDocument/publishDiagnostics", timeout=5)
+        tags = sorted(
+            (d["range"]["start"]["line"], d["message"].split()[1])
+            for d in (diag_notif or {}).get("params", {}).get("diagnostics", [])
+        )
+        check("\\r\\n 拆分/合并后增量诊断行号正确", tags == [(1, "TODO"), (4, "FIXME")], f"诊断: {tags}")
+        send(make_notification("textDocument/didClose", {"textDocument": {"uri": crlf_uri}}))
+
         # ── Summary ──
         print(f"\n{'='*60}")
-        passed = sum(results)
-        total = len(results)
+        passed, total = _passed, _total
         color = "\033[92m" if passed == total else "\033[93m"
         print(f"  {color}测试结果: {passed}/{total} 通过\033[0m")
         print(f"{'='*60}\n")
 
     finally:
-        send(make_request("shutdown"))
-        time.sleep(0.3)
+        # 等 shutdown 响应真正到达再发 exit，而不是固定 sleep
+        request("shutdown")
         send(make_notification("exit"))
         proc.wait(timeout=5)
         print(f"  Server 退出码: {proc.returncode}")
@@ -3,86 +3,162 @@ Workspace Tools MCP Server — 用于 OpenCode 的本地 MCP 服务器。
 
 提供的工具:
   - workspace_info: 获取工作区基本信息（路径、Git 状态等）
-  - list_files: 列出工作区目录下的文件
-  - search_text: 在工作区文件中搜索文本
-  - read_file: 读取文件内容
-  - create_file: 创建新文件（含目录自动创建）
-  - edit_file: 编辑已有文件（按行号替换或插入）
   - system_status: 获取系统资源状态（CPU、内存、磁盘）
-  - run_python: 执行简单的 Python 表达式并返回结果
+
+已停用的 list_files / search_text / read_file / create_file / edit_file / run_python
+保存在同目录的 disabled_tools.py.bak 中。
 """
 
 import os
-import glob
-import json
 import subprocess
 import platform
+import shutil
+import time
 from datetime import datetime
 
 from fastmcp import FastMCP
 
 mcp = FastMCP("workspace-tools")
 
+# 以下平台信息在进程生命周期内不变，模块加载时取一次，避免每次工具调用重复 uname/文件读取
+_PLATFORM = platform.system()
+_PY_VER = platform.python_version()
+_PLAT_FULL = platform.platform()
+_MACHINE = platform.machine()
+_HOST = platform.node()
+
+# 统计文件数时跳过的目录：数量庞大且很少有参考价值（.git/.venv 等隐藏项已按 glob 语义跳过）
+_SKIP_DIRS = frozenset({"node_modules", "__pycache__"})
+
+
+def _count_files(root: str) -> int:
+    """基于 os.scandir 的非递归遍历，复用 dirent 类型信息，避免 glob 的逐项 stat。
+
+    与原先的 glob("**") 一致，跳过以 "." 开头的隐藏文件和目录。
+    """
+    n = 0
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.name.startswith(".") or entry.name in _SKIP_DIRS:
+                    continue
+                n += 1
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                except OSError:
+                    pass
+    return n
+
+
+def _parse_branch(header: str) -> str:
+    """解析 porcelain 首行 `## main...origin/main [ahead 1]`，游离 HEAD 时返回空串。"""
+    if not header.startswith("## "):
+        return ""
+    name = header[3:].split("...", 1)[0]
+    for prefix in ("No commits yet on ", "Initial commit on "):
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return "" if name.startswith("HEAD (no branch)") else name
+
+
+# cwd -> (取值时间, git 信息)；agent 常在同一轮推理里连续调用 workspace_info
+GIT_CACHE_TTL = 1.5
+_git_cache: dict[str, tuple[float, dict]] = {}
+
+
+def _git_info(cwd: str) -> dict:
+    """一次 `git status -b` 同时拿到分支名（首行 `## <branch>...`）和改动列表。"""
+    now = time.monotonic()
+    cached = _git_cache.get(cwd)
+    if cached and now - cached[0] < GIT_CACHE_TTL:
+        return cached[1]
 
-@mcp.tool()
-def workspace_info() -> str:
-    """获取当前工作区的基本信息，包括路径、Git 分支、文件数量等。"""
-    cwd = os.getcwd()
-    info = {
-        "workspace_path": cwd,
-        "timestamp": datetime.now().isoformat(),
-        "platform": platform.system(),
-        "python_version": platform.python_version(),
-    }
-
-    # Git info
     try:
-        branch = subprocess.check_output(
-            ["git", "branch", "--show-current"],
+        out = subprocess.check_output(
+            ["git", "status", "-b", "--porcelain=v1"],
             cwd=cwd,
             stderr=subprocess.DEVNULL,
             text=True,
-        ).strip()
-        info["git_branch"] = branch
-
-        status = subprocess.check_output(
-            ["git", "status", "--porcelain"],
-            cwd=cwd,
-            stderr=subprocess.DEVNULL,
-            text=True,
-        ).strip()
-        info["git_changed_files"] = len(status.splitlines()) if status else 0
+        )
+        lines = out.splitlines()
+        git_info = {
+            "git_branch": _parse_branch(lines[0]) if lines else "",
+            "git_changed_files": max(len(lines) - 1, 0),
+        }
     except (subprocess.CalledProcessError, FileNotFoundError):
-        info["git"] = "not available"
+        git_info = {"git": "not available"}
 
-    # File count
-    total_files = sum(1 for _ in glob.iglob(os.path.join(cwd, "**"), recursive=True))
-    info["total_files"] = total_files
+    _git_cache[cwd] = (now, git_info)
+    return git_info
 
-    return json.dumps(info, indent=2, ensure_ascii=False)
 
 @mcp.tool()
-def system_status() -> str:
-    """获取系统资源状态，包括 CPU、内存、磁盘等信息。"""
+def workspace_info() -> dict:
+    """获取当前工作区的基本信息，包括路径、Git 分支、文件数量等。"""
+    cwd = os.getcwd()
     info = {
-        "platform": platform.platform(),
-        "architecture": platform.machine(),
-        "hostname": platform.node(),
+        "workspace_path": cwd,
         "timestamp": datetime.now().isoformat(),
+        "platform": _PLATFORM,
+        "python_version": _PY_VER,
     }
 
-    # Disk usage
+    # Git info — 短时缓存，避免 agent 连续调用时反复 fork git
+    info.update(_git_info(cwd))
+
+    # File count
+    info["total_files"] = _count_files(cwd)
+
+    return info
+
+
+DISK_CACHE_TTL = 5.0
+_disk_cache: tuple[float, dict | str] | None = None
+
+
+def _disk_usage() -> dict | str:
+    """shutil.disk_usage 跨平台直接给出 total/used/free，结果缓存 DISK_CACHE_TTL 秒。"""
+    global _disk_cache
+    now = time.monotonic()
+    if _disk_cache and now - _disk_cache[0] < DISK_CACHE_TTL:
+        return _disk_cache[1]
+
     try:
-        stat = os.statvfs("/")
-        total = stat.f_blocks * stat.f_frsize
-        free = stat.f_bfree * stat.f_frsize
-        info["disk"] = {
+        total, used, _ = shutil.disk_usage("/")
+        # disk_usage 的 free 是普通用户可用空间（f_bavail）；两个字段都由 used 推出，
+        # 保持原 statvfs f_bfree 的口径（root 保留块不计为已用）
+        free = total - used
+        disk = {
             "total_gb": round(total / (1024**3), 2),
             "free_gb": round(free / (1024**3), 2),
             "used_percent": round((1 - free / total) * 100, 1),
         }
-    except (OSError, AttributeError):
-        info["disk"] = "unavailable"
+    except OSError:
+        disk = "unavailable"
+
+    _disk_cache = (now, disk)
+    return disk
+
+
+@mcp.tool()
+def system_status() -> dict:
+    """获取系统资源状态，包括 CPU、内存、磁盘等信息。"""
+    info = {
+        "platform": _PLAT_FULL,
+        "architecture": _MACHINE,
+        "hostname": _HOST,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+    # Disk usage — 磁盘占用变化远慢于调用频率，短时缓存
+    info["disk"] = _disk_usage()
 
     # Node.js version
     try:
@@ -93,218 +169,7 @@ def system_status() -> str:
     except (subprocess.CalledProcessError, FileNotFoundError):
         info["node_version"] = "not installed"
 
-    return json.dumps(info, indent=2, ensure_ascii=False)
-
-# @mcp.tool()
-# def list_files(path: str = ".", pattern: str = "*", max_depth: int = 3) -> str:
-#     """列出指定目录下的文件和目录。
-
-#     Args:
-#         path: 相对于工作区的路径，默认为当前目录
-#         pattern: 文件匹配模式（glob），默认为 '*'
-#         max_depth: 最大递归深度，默认为 3
-#     """
-#     base = os.path.abspath(path)
-#     if not os.path.isdir(base):
-#         return json.dumps({"error": f"目录不存在: {path}"}, ensure_ascii=False)
-
-#     results = []
-#     for root, dirs, files in os.walk(base):
-#         depth = root.replace(base, "").count(os.sep)
-#         if depth >= max_depth:
-#             dirs.clear()
-#             continue
-
-#         rel_root = os.path.relpath(root, base)
-#         for f in sorted(files):
-#             if glob.fnmatch.fnmatch(f, pattern):
-#                 fp = os.path.join(rel_root, f) if rel_root != "." else f
-#                 size = os.path.getsize(os.path.join(root, f))
-#                 results.append({"file": fp, "size_bytes": size})
-
-#     return json.dumps(
-#         {"base": base, "pattern": pattern, "count": len(results), "files": results[:100]},
-#         indent=2,
-#         ensure_ascii=False,
-#     )
-
-
-# @mcp.tool()
-# def search_text(query: str, file_pattern: str = "*.py", max_results: int = 20) -> str:
-#     """在工作区文件中搜索文本内容。
-
-#     Args:
-#         query: 要搜索的文本
-#         file_pattern: 文件匹配模式，默认为 '*.py'
-#         max_results: 最大返回结果数，默认 20
-#     """
-#     cwd = os.getcwd()
-#     results = []
-#     for filepath in glob.iglob(os.path.join(cwd, "**", file_pattern), recursive=True):
-#         try:
-#             with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-#                 for i, line in enumerate(f, 1):
-#                     if query.lower() in line.lower():
-#                         results.append({
-#                             "file": os.path.relpath(filepath, cwd),
-#                             "line": i,
-#                             "content": line.strip()[:200],
-#                         })
-#                         if len(results) >= max_results:
-#                             break
-#         except (OSError, UnicodeDecodeError):
-#             continue
-#         if len(results) >= max_results:
-#             break
-
-#     return json.dumps(
-#         {"query": query, "pattern": file_pattern, "count": len(results), "results": results},
-#         indent=2,
-#         ensure_ascii=False,
-#     )
-
-
-# @mcp.tool()
-# def read_file(path: str, start_line: int = 0, end_line: int = 0) -> str:
-#     """读取文件内容。可以指定行号范围只读取部分内容。
-
-#     Args:
-#         path: 文件路径（相对于工作区或绝对路径）
-#         start_line: 起始行号（从 1 开始），0 表示从头开始
-#         end_line: 结束行号（包含），0 表示读到末尾
-#     """
-#     filepath = os.path.abspath(path)
-#     if not os.path.isfile(filepath):
-#         return json.dumps({"error": f"文件不存在: {path}"}, ensure_ascii=False)
-
-#     try:
-#         with open(filepath, "r", encoding="utf-8", errors="replace") as f:
-#             lines = f.readlines()
-
-#         total = len(lines)
-#         s = max(1, start_line) - 1 if start_line > 0 else 0
-#         e = min(total, end_line) if end_line > 0 else total
-
-#         numbered = [f"{i + s + 1:>4}| {line.rstrip()}" for i, line in enumerate(lines[s:e])]
-#         content = "\n".join(numbered)
-
-#         return json.dumps({
-#             "file": filepath,
-#             "total_lines": total,
-#             "showing": f"{s + 1}-{e}",
-#             "content": content,
-#         }, indent=2, ensure_ascii=False)
-#     except Exception as exc:
-#         return json.dumps({"error": str(exc)}, ensure_ascii=False)
-
-
-# @mcp.tool()
-# def create_file(path: str, content: str = "", overwrite: bool = False) -> str:
-#     """创建新文件。自动创建所需的父目录。
-
-#     Args:
-#         path: 文件路径（相对于工作区或绝对路径）
-#         content: 文件内容，默认为空
-#         overwrite: 如果文件已存在，是否覆盖，默认为 False
-#     """
-#     filepath = os.path.abspath(path)
-
-#     if os.path.exists(filepath) and not overwrite:
-#         return json.dumps({
-#             "error": f"文件已存在: {path}（使用 overwrite=true 覆盖）"
-#         }, ensure_ascii=False)
-
-#     try:
-#         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-#         with open(filepath, "w", encoding="utf-8") as f:
-#             f.write(content)
-
-#         return json.dumps({
-#             "status": "created",
-#             "file": filepath,
-#             "size_bytes": os.path.getsize(filepath),
-#             "lines": content.count("\n") + (1 if content else 0),
-#         }, indent=2, ensure_ascii=False)
-#     except Exception as exc:
-#         return json.dumps({"error": str(exc)}, ensure_ascii=False)
-
-
-# @mcp.tool()
-# def edit_file(
-#     path: str,
-#     new_content: str,
-#     start_line: int = 0,
-#     end_line: int = 0,
-#     insert_mode: str = "replace",
-# ) -> str:
-#     """编辑已有文件的指定行范围，支持替换、插入和追加。
-
-#     Args:
-#         path: 文件路径
-#         new_content: 新内容
-#         start_line: 起始行号（从 1 开始）。0 表示整个文件替换。
-#         end_line: 结束行号（包含）。0 且 start_line 也为 0 时替换整个文件。
-#         insert_mode: 'replace' 替换指定行 | 'before' 在 start_line 前插入 | 'after' 在 end_line 后插入 | 'append' 追加到文件末尾
-#     """
-#     filepath = os.path.abspath(path)
-#     if not os.path.isfile(filepath):
-#         return json.dumps({"error": f"文件不存在: {path}"}, ensure_ascii=False)
-
-#     try:
-#         with open(filepath, "r", encoding="utf-8") as f:
-#             lines = f.readlines()
-
-#         new_lines = new_content.splitlines(keepends=True)
-#         if new_content and not new_content.endswith("\n"):
-#             new_lines[-1] += "\n"
-
-#         if insert_mode == "append":
-#             lines.extend(new_lines)
-#         elif start_line == 0 and end_line == 0:
-#             lines = new_lines
-#         else:
-#             s = max(1, start_line) - 1
-#             e = min(len(lines), end_line) if end_line > 0 else s + 1
-
-#             if insert_mode == "before":
-#                 lines = lines[:s] + new_lines + lines[s:]
-#             elif insert_mode == "after":
-#                 lines = lines[:e] + new_lines + lines[e:]
-#             else:  # replace
-#                 lines = lines[:s] + new_lines + lines[e:]
-
-#         with open(filepath, "w", encoding="utf-8") as f:
-#             f.writelines(lines)
-
-#         return json.dumps({
-#             "status": "edited",
-#             "file": filepath,
-#             "total_lines": len(lines),
-#             "mode": insert_mode,
-#         }, indent=2, ensure_ascii=False)
-#     except Exception as exc:
-#         return json.dumps({"error": str(exc)}, ensure_ascii=False)
-# 
-# @mcp.tool()
-# def run_python(expression: str) -> str:
-#     """执行一个 Python 表达式并返回结果。适用于简单计算和数据处理。
-
-#     Args:
-#         expression: 要执行的 Python 表达式
-#     """
-#     try:
-#         result = eval(expression)  # noqa: S307
-#         return json.dumps(
-#             {"expression": expression, "result": str(result), "type": type(result).__name__},
-#             indent=2,
-#             ensure_ascii=False,
-#         )
-#     except Exception as e:
-#         return json.dumps(
-#             {"expression": expression, "error": str(e), "error_type": type(e).__name__},
-#             indent=2,
-#             ensure_ascii=False,
-#         )
+    return info
 
 
 if __name__ == "__main__":